@@ -0,0 +1,149 @@
+import os
+import sys
+import threading
+import numpy as np
+from PIL import Image
+from typing import Iterator, List, Optional, Tuple
+
+# ---------------- CONFIG ----------------
+
+RIFE_DIR = os.path.abspath("Practical-RIFE")
+RIFE_MODEL_DIR = os.path.join(RIFE_DIR, "train_log")
+RIFE_TILE = 512        # output window size; canvases are processed tile by tile
+RIFE_HALO = 32         # context on every side of a window, cropped after inference
+RIFE_BATCH_SIZE = 8    # windows evaluated per forward pass
+RIFE_FP16 = True       # half precision on CUDA; ignored on CPU
+
+_model = None
+_device = None
+_dtype = None
+_model_lock = threading.Lock()
+
+# ---------------- MODEL ----------------
+
+def load_model():
+    # Load Practical-RIFE once per process and keep it resident on the GPU. The sync
+    # FastAPI endpoint runs in a threadpool, so concurrent first requests share one load.
+    global _model, _device, _dtype
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is not None:
+            return _model
+        import torch
+        if RIFE_DIR not in sys.path:
+            sys.path.insert(0, RIFE_DIR)
+        from train_log.RIFE_HDv3 import Model
+
+        _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        use_fp16 = RIFE_FP16 and _device.type == "cuda"
+        _dtype = torch.float16 if use_fp16 else torch.float32
+        if _device.type == "cuda":
+            # Every frame in a session has the same padded size, so autotuning pays off
+            torch.backends.cudnn.benchmark = True
+
+        model = Model()
+        model.load_model(RIFE_MODEL_DIR, -1)
+        model.eval()
+        model.device()
+        if use_fp16:
+            model.flownet.half()
+        _model = model
+    return _model
+
+def _to_tensor(rgb: np.ndarray, padding: Tuple[int, int, int, int]):
+    import torch
+    import torch.nn.functional as F
+
+    tensor = torch.from_numpy(np.ascontiguousarray(rgb)).to(_device, non_blocking=True)
+    tensor = tensor.permute(2, 0, 1).unsqueeze(0).float() / 255.0
+    return F.pad(tensor, padding, mode="replicate").to(_dtype)
+
+def iter_windows(height: int, width: int) -> Iterator[Tuple[int, int]]:
+    # Top-left corners of RIFE_TILE windows covering the canvas. In the padded tensor the
+    # same corner addresses the window including its halo, since padding adds RIFE_HALO first.
+    for y in range(0, height, RIFE_TILE):
+        for x in range(0, width, RIFE_TILE):
+            yield y, x
+
+# ---------------- INTERPOLATION ----------------
+
+def interpolate_sequence(frame_paths: List[str], steps: int) -> Iterator[Tuple[int, int, np.ndarray]]:
+    # Yields (pair_index, step, rgba_frame) for every consecutive frame pair.
+    # Step 0 is the pair's first frame; steps 1..steps-1 are RIFE outputs at t = step/steps.
+    # Canvases are split into overlapping RIFE_TILE windows (RIFE_TILE + 2 * RIFE_HALO is a
+    # multiple of 64, as RIFE_HDv3 requires) so activations stay small regardless of the
+    # stitched size. Windows that are fully transparent in both frames are left empty and
+    # windows that did not change between the frames are copied through without RIFE.
+    # RGB goes through RIFE and alpha is blended linearly. Each source frame is uploaded
+    # to the device once and reused as the start of the next pair.
+    import torch
+
+    model = load_model()
+    window = RIFE_TILE + 2 * RIFE_HALO
+    prev_rgba: Optional[np.ndarray] = None
+    prev_tensor = None
+    padding = None
+
+    with torch.no_grad():
+        for index, path in enumerate(frame_paths):
+            rgba = np.asarray(Image.open(path).convert("RGBA"))
+            h, w = rgba.shape[:2]
+            if padding is None:
+                ph = ((h - 1) // RIFE_TILE + 1) * RIFE_TILE
+                pw = ((w - 1) // RIFE_TILE + 1) * RIFE_TILE
+                padding = (RIFE_HALO, RIFE_HALO + pw - w, RIFE_HALO, RIFE_HALO + ph - h)
+            tensor = _to_tensor(rgba[..., :3], padding)
+
+            if prev_rgba is not None:
+                pair_index = index - 1
+                yield pair_index, 0, prev_rgba
+
+                alpha0 = prev_rgba[..., 3]
+                alpha1 = rgba[..., 3]
+                active, static = [], []
+                for y, x in iter_windows(ph, pw):
+                    tile0 = prev_rgba[y:y + RIFE_TILE, x:x + RIFE_TILE]
+                    tile1 = rgba[y:y + RIFE_TILE, x:x + RIFE_TILE]
+                    # Only windows with no visible pixel in either frame may be skipped: their
+                    # blended alpha is 0 everywhere, so the empty RGB never shows
+                    if not (tile0[..., 3].any() or tile1[..., 3].any()):
+                        continue
+                    # Strided comparison rejects most changed windows before the full compare
+                    if np.array_equal(tile0[::8, ::8], tile1[::8, ::8]) and np.array_equal(tile0, tile1):
+                        static.append((y, x))
+                    else:
+                        active.append((y, x))
+                windows0 = torch.stack([prev_tensor[0, :, y:y + window, x:x + window] for y, x in active]) if active else None
+                windows1 = torch.stack([tensor[0, :, y:y + window, x:x + window] for y, x in active]) if active else None
+
+                # Empty and static windows are the same at every step, so they are laid down once
+                base = torch.zeros((3, ph, pw), device=_device, dtype=_dtype)
+                for y, x in static:
+                    base[:, y:y + RIFE_TILE, x:x + RIFE_TILE] = prev_tensor[
+                        0, :, y + RIFE_HALO:y + RIFE_HALO + RIFE_TILE, x + RIFE_HALO:x + RIFE_HALO + RIFE_TILE
+                    ]
+
+                alpha0 = alpha0.astype(np.float32)
+                alpha1 = alpha1.astype(np.float32)
+                for step in range(1, steps):
+                    ts = step / steps
+                    canvas = base.clone()
+                    for start in range(0, len(active), RIFE_BATCH_SIZE):
+                        batch = active[start:start + RIFE_BATCH_SIZE]
+                        n = len(batch)
+                        t = torch.full((n, 1, 1, 1), ts, device=_device, dtype=_dtype)
+                        with torch.autocast(device_type=_device.type, dtype=_dtype, enabled=_dtype == torch.float16):
+                            out = model.inference(windows0[start:start + n], windows1[start:start + n], t)
+                        out = out[:, :, RIFE_HALO:RIFE_HALO + RIFE_TILE, RIFE_HALO:RIFE_HALO + RIFE_TILE]
+                        for k, (y, x) in enumerate(batch):
+                            canvas[:, y:y + RIFE_TILE, x:x + RIFE_TILE] = out[k]
+
+                    rgb = (canvas[:, :h, :w].float().clamp(0, 1) * 255).round().byte()
+                    frame = np.empty((h, w, 4), dtype=np.uint8)
+                    frame[..., :3] = rgb.permute(1, 2, 0).cpu().numpy()
+                    frame[..., 3] = np.rint(alpha0 * (1 - ts) + alpha1 * ts)
+                    yield pair_index, step, frame
+
+            prev_rgba = rgba
+            prev_tensor = tensor
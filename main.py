@@ -4,28 +4,47 @@ from pydantic import BaseModel
 from typing import List, Tuple, Optional
 from pyproj import Transformer
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from PIL import Image
 from io import BytesIO
+from urllib.parse import urlencode
+import numpy as np
 import os
 import math
-import requests
-import pytz
+import httpx
+import asyncio
 import uuid
 import shutil
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from subprocess import run, CalledProcessError
-import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, PIPE
+from interpolator import interpolate_sequence
+from raw_data_fetcher import tile_has_data
 
 # ---------------- CONFIG ----------------
 
 TILE_SIZE_PX = 256
 TIME_INTERVAL_MINUTES = 30
 MAX_WORKERS = 8
+MAX_CONCURRENT_TILES = 128
+MAX_CONNECTIONS = 128
+MAX_KEEPALIVE_CONNECTIONS = 64
 RETRIES = 2
 TIMEOUT = 20
 RETRY_DELAY = 2
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 FFMPEG_PATH = "ffmpeg"
+# Stitched frames are temporary inputs for RIFE, so favour encode speed over size
+PNG_COMPRESS_LEVEL = 1
+# Fast x264 settings for session previews; on NVIDIA GPUs
+# ["-c:v", "h264_nvenc", "-preset", "p1", "-tune", "ll"] moves encoding off the CPU
+FFMPEG_ENCODE_ARGS = ["-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency", "-crf", "23"]
+RIFE_STEPS = 32        # frames generated per consecutive frame pair (2 ** exp 5)
+
+HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+# PNG decode and stitching are CPU-bound; run them off the event loop
+DECODE_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
 transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
 
@@ -50,8 +69,19 @@ WMS_BASE_TEMPLATE = (
     "3R_IMG/{folder_date}/3RIMG_{file_date}_{time}_L1B_STD_V01R00.h5"
 )
 
+IST = ZoneInfo("Asia/Kolkata")
+UTC = ZoneInfo("UTC")
+# Upper-case month abbreviations as used in MOSDAC paths; avoids strftime and its locale dependence
+MONTH_ABBR = ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC")
+
+COMMON_QUERY = urlencode(COMMON_PARAMS)
+
 TEMP_SESSION_DIRS = set()
 
+# LRU of WMS frame URLs already known to serve tiles
+WMS_AVAILABILITY_CACHE = OrderedDict()
+WMS_AVAILABILITY_CACHE_SIZE = 1024
+
 # ---------------- FASTAPI ----------------
 
 app = FastAPI()
@@ -71,44 +101,123 @@ class TileRequest(BaseModel):
 class InterpolationRequest(BaseModel):
     session_id: str
 
-def fetch_with_retries(url, params, retries=RETRIES, delay=RETRY_DELAY) -> Optional[requests.Response]:
+def get_http_client() -> httpx.AsyncClient:
+    global HTTP_CLIENT
+    if HTTP_CLIENT is None:
+        HTTP_CLIENT = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=TIMEOUT,
+            headers={"Accept-Encoding": "gzip"},
+        )
+    return HTTP_CLIENT
+
+async def fetch_with_retries(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url, retries=RETRIES, delay=RETRY_DELAY) -> Optional[httpx.Response]:
+    # Only transport errors and RETRY_STATUSES are retried; the slot is released while backing off
     for attempt in range(retries + 1):
         try:
-            response = requests.get(url, params=params, timeout=TIMEOUT)
-            response.raise_for_status()
-            return response
-        except requests.exceptions.RequestException as e:
+            async with semaphore:
+                response = await client.get(url)
+            if response.status_code == 200:
+                return response
+            if response.status_code not in RETRY_STATUSES:
+                return None
+            print(f"⚠️ Retry {attempt+1}/{retries} failed: HTTP {response.status_code}")
+        except httpx.TransportError as e:
             print(f"⚠️ Retry {attempt+1}/{retries} failed: {e}")
-            if attempt < retries:
-                time.sleep(delay)
+        if attempt < retries:
+            await asyncio.sleep(delay * (2 ** attempt))
     return None
 
-def download_tile(col: int, row: int, bbox: List[float], wms_url: str, timestamp_str: str) -> Optional[Tuple[int, int, Image.Image]]:
-    params = COMMON_PARAMS.copy()
-    params["BBOX"] = f"{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
-    response = fetch_with_retries(wms_url, params)
+async def check_wms_availability(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, wms_url: str, tile_query: str) -> bool:
+    # A blank (fully transparent) probe tile means no data for that time, as in the raw fetcher.
+    # Only successful probes are cached: a missing timestamp may still be published later
+    if wms_url in WMS_AVAILABILITY_CACHE:
+        WMS_AVAILABILITY_CACHE.move_to_end(wms_url)
+        return True
+    response = await fetch_with_retries(client, semaphore, f"{wms_url}?{tile_query}")
+    if response is None or not tile_has_data(response.content):
+        return False
+    WMS_AVAILABILITY_CACHE[wms_url] = True
+    if len(WMS_AVAILABILITY_CACHE) > WMS_AVAILABILITY_CACHE_SIZE:
+        WMS_AVAILABILITY_CACHE.popitem(last=False)
+    return True
+
+def decode_tile(content: bytes, out: np.ndarray):
+    # WMS tiles are always PNG, so skip Pillow's format probing, and only convert
+    # when the server did not already send RGBA (palette/greyscale tiles)
+    image = Image.open(BytesIO(content), formats=("PNG",))
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    out[...] = np.asarray(image, dtype=np.uint8)
+
+def build_tile_grid(min_x: float, min_y: float, cols: int, rows: int, tile_extent: float) -> Tuple[np.ndarray, List[str]]:
+    # Row-major (col, row) indices and the complete GetMap query string of every tile,
+    # URL-encoded once per request instead of once per tile and timestamp.
+    # float64 is kept on purpose: EPSG:3857 metres exceed float32 precision.
+    cc, rr = np.meshgrid(np.arange(cols), np.arange(rows), indexing="xy")
+    x0 = min_x + cc.ravel() * tile_extent
+    y0 = min_y + rr.ravel() * tile_extent
+    bboxes = np.stack([x0, y0, x0 + tile_extent, y0 + tile_extent], axis=-1)
+    indices = np.stack([cc.ravel(), rr.ravel()], axis=-1)
+    tile_queries = [
+        f"{COMMON_QUERY}&{urlencode({'BBOX': ','.join(map(repr, bbox))})}"
+        for bbox in bboxes.tolist()
+    ]
+    return indices, tile_queries
+
+async def download_tile(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, col: int, row: int, tile_url: str, out: np.ndarray) -> bool:
+    # Decodes straight into this tile's slot of the frame buffer; every task owns a distinct slot
+    response = await fetch_with_retries(client, semaphore, tile_url)
     if response is None:
-        return None
+        return False
     try:
-        image = Image.open(BytesIO(response.content)).convert("RGBA")
-        return (col, row, image)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(DECODE_EXECUTOR, decode_tile, response.content, out)
+        return True
     except Exception as e:
         print(f"❌ Failed tile ({col},{row}) - {e}")
-        return None
+        return False
+
+def stitch_and_save(tile_buf: np.ndarray, cols: int, rows: int, path: str):
+    # tile_buf holds the tiles in row-major grid order with row 0 at the bottom (south), so the
+    # whole stitch is one flip + transpose into image layout. Unfetched slots stay transparent.
+    canvas = (
+        tile_buf.reshape(rows, cols, TILE_SIZE_PX, TILE_SIZE_PX, 4)[::-1]
+        .transpose(0, 2, 1, 3, 4)
+        .reshape(rows * TILE_SIZE_PX, cols * TILE_SIZE_PX, 4)
+    )
+    Image.fromarray(canvas, "RGBA").save(path, compress_level=PNG_COMPRESS_LEVEL, optimize=False)
+
+async def fetch_frame(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, wms_url: str, tile_indices: List[List[int]], tile_queries: List[str], cols: int, rows: int, frame_path: str) -> bool:
+    # The frame's tiles live in one (cols*rows, 256, 256, 4) buffer indexed like tile_queries
+    tile_buf = np.zeros((rows * cols, TILE_SIZE_PX, TILE_SIZE_PX, 4), dtype=np.uint8)
+    results = await asyncio.gather(*[
+        download_tile(client, semaphore, col, row, f"{wms_url}?{tile_query}", tile_buf[idx])
+        for idx, ((col, row), tile_query) in enumerate(zip(tile_indices, tile_queries))
+    ])
+    if not any(results):
+        return False
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(DECODE_EXECUTOR, stitch_and_save, tile_buf, cols, rows, frame_path)
+    return True
 
 @app.post("/fetch-stitched-frames")
-def fetch_stitched_frames(req: TileRequest):
-    ist = pytz.timezone("Asia/Kolkata")
-    start_dt = ist.localize(datetime.strptime(req.datetime, "%Y-%m-%d %H:%M"))
-    end_dt = ist.localize(datetime.strptime(req.endtime, "%Y-%m-%d %H:%M"))
+async def fetch_stitched_frames(req: TileRequest):
+    start_dt = datetime.strptime(req.datetime, "%Y-%m-%d %H:%M").replace(tzinfo=IST)
+    end_dt = datetime.strptime(req.endtime, "%Y-%m-%d %H:%M").replace(tzinfo=IST)
     if start_dt.minute not in [15, 45] or end_dt.minute not in [15, 45]:
         raise HTTPException(status_code=400, detail="Only :15 or :45 minutes allowed.")
     if start_dt > end_dt:
         raise HTTPException(status_code=400, detail="Start time must be before end time.")
 
     min_lon, min_lat, max_lon, max_lat = req.bbox
-    min_x, min_y = transformer.transform(min_lon, min_lat)
-    max_x, max_y = transformer.transform(max_lon, max_lat)
+    xs, ys = transformer.transform(np.array([min_lon, max_lon]), np.array([min_lat, max_lat]))
+    min_x, max_x = xs.tolist()
+    min_y, max_y = ys.tolist()
 
     mpp = 156543.03 / (2 ** req.zoom)
     tile_extent = TILE_SIZE_PX * mpp
@@ -117,51 +226,59 @@ def fetch_stitched_frames(req: TileRequest):
     cols = math.ceil((max_x - snapped_min_x) / tile_extent)
     rows = math.ceil((max_y - snapped_min_y) / tile_extent)
 
+    if cols <= 0 or rows <= 0:
+        raise HTTPException(status_code=400, detail="Bounding box covers no tiles.")
     if cols * rows > 400:
         raise HTTPException(status_code=400, detail="Too many tiles requested.")
 
+    tile_indices, tile_queries = build_tile_grid(snapped_min_x, snapped_min_y, cols, rows, tile_extent)
+    tile_indices = tile_indices.tolist()
+
     session_id = uuid.uuid4().hex[:8]
     temp_dir = os.path.join(os.path.dirname(__file__), "temp_stitched", f"session_{session_id}")
     os.makedirs(temp_dir, exist_ok=True)
     TEMP_SESSION_DIRS.add(temp_dir)
 
+    client = get_http_client()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TILES)
+
+    frame_urls = []
+    step = timedelta(minutes=TIME_INTERVAL_MINUTES)
     current_time = start_dt
+    utc_time = start_dt.astimezone(UTC)
     while current_time <= end_dt:
-        utc_time = current_time.astimezone(pytz.utc)
-        folder_date = utc_time.strftime("%Y/%d%b").upper()
-        file_date = utc_time.strftime("%d%b%Y").upper()
-        time_str = utc_time.strftime("%H%M")
-        timestamp_str = current_time.strftime("%H%M")
+        day_month = f"{utc_time.day:02d}{MONTH_ABBR[utc_time.month - 1]}"
+        timestamp_str = f"{current_time.hour:02d}{current_time.minute:02d}"
 
         wms_url = WMS_BASE_TEMPLATE.format(
-            folder_date=folder_date,
-            file_date=file_date,
-            time=time_str
+            folder_date=f"{utc_time.year}/{day_month}",
+            file_date=f"{day_month}{utc_time.year}",
+            time=f"{utc_time.hour:02d}{utc_time.minute:02d}"
         )
-
-        tile_tasks = []
-        for row in range(rows):
-            for col in range(cols):
-                x0 = snapped_min_x + col * tile_extent
-                y0 = snapped_min_y + row * tile_extent
-                bbox = [x0, y0, x0 + tile_extent, y0 + tile_extent]
-                tile_tasks.append((col, row, bbox, wms_url, timestamp_str))
-
-        tile_images = []
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = [executor.submit(download_tile, *task) for task in tile_tasks]
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    tile_images.append(result)
-
-        if tile_images:
-            stitched_img = Image.new("RGBA", (cols * TILE_SIZE_PX, rows * TILE_SIZE_PX))
-            for col, row, img in tile_images:
-                stitched_img.paste(img, (col * TILE_SIZE_PX, (rows - 1 - row) * TILE_SIZE_PX))
-            stitched_img.save(os.path.join(temp_dir, f"frame_{timestamp_str}.png"))
-
-        current_time += timedelta(minutes=TIME_INTERVAL_MINUTES)
+        frame_urls.append((timestamp_str, wms_url))
+
+        # Both clocks advance by the same fixed step, so UTC is converted only once
+        current_time += step
+        utc_time += step
+
+    # One probe per timestamp instead of cols*rows failing (and retried) tile requests
+    probe_query = tile_queries[len(tile_queries) // 2]
+    availability = await asyncio.gather(*[
+        check_wms_availability(client, semaphore, wms_url, probe_query)
+        for _, wms_url in frame_urls
+    ])
+
+    # Every available frame is fetched concurrently (the shared semaphore bounds in-flight
+    # tiles), and each frame is stitched as soon as its own tiles are in rather than after
+    # the slowest tile of the whole range
+    frame_tasks = []
+    for (timestamp_str, wms_url), available in zip(frame_urls, availability):
+        if not available:
+            print(f"⏭️ No WMS data for {timestamp_str}, skipping frame")
+            continue
+        frame_path = os.path.join(temp_dir, f"frame_{timestamp_str}.png")
+        frame_tasks.append(fetch_frame(client, semaphore, wms_url, tile_indices, tile_queries, cols, rows, frame_path))
+    await asyncio.gather(*frame_tasks)
 
     return {
         "message": "Frames stitched successfully",
@@ -173,80 +290,70 @@ def fetch_stitched_frames(req: TileRequest):
 def interpolate_and_generate_video(req: InterpolationRequest):
     session_id = req.session_id
     session_dir = os.path.join(os.path.dirname(__file__), "temp_stitched", session_id)
-    interpolated_dir = os.path.join(session_dir, "interpolated_frames")
-    os.makedirs(interpolated_dir, exist_ok=True)
 
-    frames = sorted([
-        f for f in os.listdir(session_dir)
-        if f.startswith("frame_") and f.endswith(".png")
-    ], key=lambda name: int(re.search(r"_(\d{4})", name).group(1)))
+    # Frame names are always frame_HHMM.png, so the timestamp is a fixed slice
+    frames = sorted((
+        e.name for e in os.scandir(session_dir)
+        if e.name.startswith("frame_") and e.name.endswith(".png")
+    ), key=lambda name: int(name[6:10]))
 
     def timestamp_to_minutes(ts):
         h, m = int(ts[:2]), int(ts[2:])
         return h * 60 + m
 
-    def minutes_to_timestamp(mins):
-        return f"{mins // 60:02d}{mins % 60:02d}"
-
-    rife_script_img = os.path.abspath(os.path.join("Practical-RIFE", "inference_img_preserve.py"))
-    rife_model = os.path.abspath(os.path.join("Practical-RIFE", "train_log"))
-
-    for i in range(len(frames) - 1):
-        src1 = os.path.join(session_dir, frames[i])
-        src2 = os.path.join(session_dir, frames[i + 1])
-        t1 = re.search(r"_(\d{4})", frames[i]).group(1)
-
-        tmp = os.path.join(session_dir, "tmp_rife")
-        os.makedirs(tmp, exist_ok=True)
-        shutil.copy(src1, os.path.join(tmp, "0.png"))
-        shutil.copy(src2, os.path.join(tmp, "1.png"))
-
-        try:
-            run([
-                "python", rife_script_img,
-                "--img", "0.png", "1.png",
-                "--exp", "5",
-                "--model", rife_model
-            ], cwd=tmp, check=True)
-        except CalledProcessError as e:
-            raise HTTPException(status_code=500, detail=f"RIFE interpolation failed: {e}")
-
-        start_min = timestamp_to_minutes(t1)
-        output_dir = os.path.join(tmp, "output")
-        for i in range(32):
-            new_min = start_min + i
-            ts = minutes_to_timestamp(new_min)
-            shutil.move(os.path.join(output_dir, f"{i}.png"),
-                        os.path.join(interpolated_dir, f"{ts}.png"))
-
-        shutil.rmtree(output_dir, ignore_errors=True)
-        shutil.rmtree(tmp)
-
-    # 🔁 Rename timestamped frames to 0.png, 1.png, ...
-    sorted_imgs = sorted(os.listdir(interpolated_dir), key=lambda x: int(x.split(".")[0]))
-    renaming_dir = os.path.join(interpolated_dir, "renamed")
-    os.makedirs(renaming_dir, exist_ok=True)
-
-    for i, fname in enumerate(sorted_imgs):
-        shutil.copy(os.path.join(interpolated_dir, fname), os.path.join(renaming_dir, f"{i}.png"))
+    # RIFE runs in-process so the model is loaded onto the GPU once, not once per pair
+    frame_paths = [os.path.join(session_dir, f) for f in frames]
+    start_mins = [timestamp_to_minutes(f[6:10]) for f in frames]
+    # A pair yields one frame per minute from its start; frames that run into the next
+    # pair's start minute are superseded by that pair (the last pair keeps all of them)
+    end_mins = start_mins[1:-1] + [None]
 
     video_path = os.path.join(session_dir, "interpolated_video.mp4")
 
+    # 🎞️ Interpolated frames are piped to ffmpeg as raw RGBA while RIFE produces them,
+    # so encoding overlaps with interpolation and no intermediate PNGs are written
+    ffmpeg = None
     try:
-        run([
-            FFMPEG_PATH, "-y", "-framerate", "30",
-            "-i", "%d.png",
-            "-c:v", "libx264", "-pix_fmt", "yuv420p",
-            os.path.basename(video_path)
-        ], cwd=renaming_dir, check=True)
-
-        shutil.move(os.path.join(renaming_dir, os.path.basename(video_path)), video_path)
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="FFmpeg not found. Set FFMPEG_PATH correctly.")
-    except CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"FFmpeg failed: {e}")
-
-    shutil.rmtree(renaming_dir, ignore_errors=True)
+        for pair_index, step, frame in interpolate_sequence(frame_paths, RIFE_STEPS):
+            end_min = end_mins[pair_index]
+            if end_min is not None and start_mins[pair_index] + step >= end_min:
+                continue
+            if ffmpeg is None:
+                height, width = frame.shape[:2]
+                try:
+                    ffmpeg = Popen([
+                        FFMPEG_PATH, "-y",
+                        "-f", "rawvideo", "-pix_fmt", "rgba",
+                        "-s", f"{width}x{height}", "-r", "30", "-i", "-",
+                        *FFMPEG_ENCODE_ARGS, "-pix_fmt", "yuv420p",
+                        video_path
+                    ], stdin=PIPE)
+                except FileNotFoundError:
+                    raise HTTPException(status_code=500, detail="FFmpeg not found. Set FFMPEG_PATH correctly.")
+            ffmpeg.stdin.write(frame.data)
+    except HTTPException:
+        raise
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its return code is reported below
+    except Exception as e:
+        if ffmpeg is not None:
+            # Reap the killed encoder so the long-running server doesn't collect zombies
+            ffmpeg.kill()
+            try:
+                ffmpeg.stdin.close()
+            except BrokenPipeError:
+                pass
+            ffmpeg.wait()
+        raise HTTPException(status_code=500, detail=f"RIFE interpolation failed: {e}")
+
+    if ffmpeg is None:
+        raise HTTPException(status_code=400, detail="At least two stitched frames are required.")
+    try:
+        ffmpeg.stdin.close()
+    except BrokenPipeError:
+        pass
+    if ffmpeg.wait() != 0:
+        raise HTTPException(status_code=500, detail=f"FFmpeg failed with exit code {ffmpeg.returncode}")
 
     return {
         "message": "Interpolation and video generation complete",
@@ -259,3 +366,10 @@ def cleanup_temp_sessions():
         if os.path.exists(path):
             shutil.rmtree(path, ignore_errors=True)
     TEMP_SESSION_DIRS.clear()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    global HTTP_CLIENT
+    if HTTP_CLIENT is not None:
+        await HTTP_CLIENT.aclose()
+        HTTP_CLIENT = None
@@ -1,20 +1,35 @@
 import os
 import math
-import requests
+import numpy as np
+import httpx
+import asyncio
 from PIL import Image
 from io import BytesIO
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 import re
-import pytz
-import traceback
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import sys
+import queue
+import threading
+import time
+import hashlib
+import tarfile
+from collections import OrderedDict
 
 # ------------------ CONFIG ------------------
 
 TILE_PX = 256
-MAX_WORKERS = 32
 ZOOM_LEVEL = 5
 NUM_PAST_DAYS = 10
+RETRIES = 4
+RETRY_DELAY = 0.5  # backoff base: 0.5, 1, 2, 4 s (or the server's Retry-After)
+PER_HOST_CONCURRENCY = 8  # requests in flight to MOSDAC at once, across probes and tiles; also the pool size
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+WRITER_THREADS = 2
+WRITE_QUEUE_SIZE = 64
 
 def get_tile_size_m(zoom):
     return TILE_PX * 156543.03 / (2 ** zoom)
@@ -42,6 +57,29 @@ WMS_BASE_TEMPLATE = (
     "3R_IMG/{folder_date}/3RIMG_{file_date}_{time}_L1B_STD_V01R00.h5"
 )
 
+IST = ZoneInfo("Asia/Kolkata")
+UTC = ZoneInfo("UTC")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+BLANK_TILE_MAX_BYTES = 4096
+DEDUP_CACHE_SIZE = 256
+
+SKIP_BLANK_TILES = True  # don't save fully transparent tiles (off-globe squares)
+SAVE_TILES_AS_TAR = True  # one .tar per timestamp; False keeps the (supported) one .png per tile layout
+
+TILE_SAVED = "saved"
+TILE_BLANK = "blank"
+
+# small_tile_digest() -> whether the tile is fully transparent; event loop only
+_digest_is_blank = {}
+
+# small_tile_digest() -> path of a saved tile with those bytes (per-file layout only)
+_content_paths = OrderedDict()
+_content_paths_lock = threading.Lock()
+
+# Everything but BBOX is fixed, so the common part of the query string is encoded once
+COMMON_QUERY = urlencode(COMMON_PARAMS)
+
 """FULL_DISK_BBOX = [
     -21000000,
     -21000000,
@@ -67,40 +105,119 @@ INDIA_BBOX = [
 
 log_file_path = "fetch.log"
 file_count_log_path = "file_count.log"
+LOG_MAX_BYTES = 2_000_000
+LOG_BACKUP_COUNT = 2
+LOG_FLUSH_LINES = 100
+LOG_FILE_BUFFER_BYTES = 64 * 1024
+
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def make_handler(handler, logger_name, fmt):
+    handler.setFormatter(logging.Formatter(fmt, datefmt=LOG_DATE_FORMAT))
+    handler.addFilter(logging.Filter(logger_name))
+    return handler
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    # Flushed only on rollover/close; tracks the size itself as the stock check would flush
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=LOG_FILE_BUFFER_BYTES, encoding=self.encoding, errors=self.errors)
+        self.size = os.path.getsize(self.baseFilename)
+        return stream
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes <= 0:
+            return False
+        msg_len = len(self.format(record)) + 1
+        if self.size + msg_len >= self.maxBytes:
+            return True
+        self.size += msg_len
+        return False
 
-def log_message(message):
-    timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S] ")
-    full_message = timestamp + " => " + message
-    print(full_message)
-
-    with open(log_file_path, "a+", encoding="utf-8") as log_file:
-        log_file.write(full_message + "\n")
-        log_file.seek(0)
-        lines = log_file.readlines()
+    def flush(self):
+        pass
+
+fetch_logger = logging.getLogger("fetch")
+file_count_logger = logging.getLogger("file_count")
+
+def setup_logging():
+    # Callers only enqueue records; one listener thread does all console and file I/O
+    log_queue = queue.SimpleQueue()
+    for name in ("fetch", "file_count"):
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.handlers = [QueueHandler(log_queue)]
+
+    listener = QueueListener(
+        log_queue,
+        make_handler(logging.StreamHandler(sys.stdout), "fetch", "[%(asctime)s]  => %(message)s"),
+        make_handler(
+            BufferedRotatingFileHandler(log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"),
+            "fetch", "[%(asctime)s]  => %(message)s"
+        ),
+        make_handler(
+            BufferedRotatingFileHandler(file_count_log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"),
+            "file_count", "%(message)s"
+        ),
+    )
+    listener.start()
+    return listener
+
+def stop_logging(listener):
+    # Drain the queue, close the handlers so buffered file output is written, and detach the
+    # QueueHandlers so nothing keeps queueing records that no listener drains
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    for name in ("fetch", "file_count"):
+        logging.getLogger(name).handlers = []
 
-    if len(lines) > 10000:
-        with open(log_file_path, "w", encoding="utf-8") as log_file:
-            log_file.writelines(lines[-10000:])
+def log_message(message):
+    fetch_logger.info(message)
 
-def log_file_count_block(timestamp_ist, total, success, failed):
+def log_file_count_block(timestamp_ist, total, success, failed, skipped=0, blank=0):
     timestamp_str = timestamp_ist.strftime("%Y-%m-%d %H:%M")
     block = [
         f"=== Timestamp: {timestamp_str} IST ===",
         f"Total Tiles: {total}",
+        f"Already on disk: {skipped}",
         f"Downloaded: {success}",
+        f"Blank (no image stored): {blank}",
         f"Failed: {failed}",
         "----------------------------------------\n"
     ]
-
-    with open(file_count_log_path, "a+", encoding="utf-8") as f:
-        f.writelines(line + "\n" for line in block)
-        f.seek(0)
-        lines = f.readlines()
-
-    if len(lines) > 10000:
-        with open(file_count_log_path, "w", encoding="utf-8") as f:
-            f.writelines(lines[-10000:])
-
+    file_count_logger.info("\n".join(block))
+
+
+# ------------------ HTTP ------------------
+
+def make_client():
+    # One pooled HTTP/2 client per run; http2/limits must be set on the explicit transport
+    return httpx.AsyncClient(
+        timeout=20,
+        headers={"Accept-Encoding": "gzip"},
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=PER_HOST_CONCURRENCY, max_keepalive_connections=PER_HOST_CONCURRENCY),
+            retries=RETRIES,
+        ),
+    )
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    return float(value) if value and value.isdigit() else None
+
+async def get_with_retries(client, host_semaphore, url, timeout, retries=RETRIES, delay=RETRY_DELAY):
+    # The transport only retries failed connects; retry throttling/server errors here.
+    # The host slot is released while backing off.
+    for attempt in range(retries + 1):
+        async with host_semaphore:
+            response = await client.get(url, timeout=timeout)
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        await asyncio.sleep(retry_after_seconds(response) or delay * (2 ** attempt))
 
 # ------------------ TILE UTILS ------------------
 
@@ -112,19 +229,46 @@ def snap_bbox_to_tile_grid(minx, miny, maxx, maxy, tile_size):
     return snapped_minx, snapped_miny, snapped_maxx, snapped_maxy
 
 def generate_tiles(minx, miny, maxx, maxy, tile_size):
+    # Returns (indices, bboxes): an (N, 2) int array of (x, y) tile indices and the matching
+    # (N, 4) float64 bbox array, ordered column by column like the original nested loop
     minx, miny, maxx, maxy = snap_bbox_to_tile_grid(minx, miny, maxx, maxy, tile_size)
-    tiles = []
-    for x in range(int((maxx - minx) / tile_size)):
-        for y in range(int((maxy - miny) / tile_size)):
-            x0 = minx + x * tile_size
-            y0 = miny + y * tile_size
-            bbox = [x0, y0, x0 + tile_size, y0 + tile_size]
-            tiles.append((x, y, bbox))
-    return tiles
-
-def validate_wms_availability(wms_url):
-    params = COMMON_PARAMS.copy()
+    # The snapped extent is a whole number of tiles; round() rather than int() so that
+    # floating-point error (e.g. 25.999999) cannot silently drop the last column/row
+    nx = round((maxx - minx) / tile_size)
+    ny = round((maxy - miny) / tile_size)
+    xx, yy = np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij")
+    x0 = minx + xx.ravel() * tile_size
+    y0 = miny + yy.ravel() * tile_size
+    indices = np.stack([xx.ravel(), yy.ravel()], axis=-1)
+    bboxes = np.stack([x0, y0, x0 + tile_size, y0 + tile_size], axis=-1)
+    return indices, bboxes
+
+def bbox_query(bbox_str):
+    # Complete GetMap query string for one tile; COMMON_QUERY is encoded once at import
+    return f"{COMMON_QUERY}&{urlencode({'BBOX': bbox_str})}"
+
+def format_bbox_strings(bboxes):
+    # WMS BBOX strings for every tile, formatted once per grid rather than per request.
+    # str() formatting is kept so tile filenames stay identical to earlier runs.
+    return [",".join(map(str, bbox)) for bbox in bboxes.tolist()]
+
+_FILENAME_TRANS = str.maketrans(".,", "__")
+
+def bbox_filename_suffixes(bbox_strs):
+    # Filename tail of every tile ("<bbox>.png" with '.' and ',' replaced by '_'). It does not
+    # depend on the timestamp, so it is built once per grid instead of once per tile and frame.
+    return [bbox_str.translate(_FILENAME_TRANS) + ".png" for bbox_str in bbox_strs]
+
+def tile_has_data(content):
+    # False for non-PNG bodies (WMS errors) and fully transparent tiles; a blank tile deflates
+    # to a few hundred bytes, so only small bodies need decoding to tell blank from sparse
+    if not content.startswith(PNG_SIGNATURE):
+        return False
+    if len(content) > BLANK_TILE_MAX_BYTES:
+        return True
+    return Image.open(BytesIO(content)).getbbox() is not None
 
+async def validate_wms_availability(client, host_semaphore, wms_url):
     # Sample a central tile (around the center of the Full disk BBOX)
     """center_x = (FULL_DISK_BBOX[0] + FULL_DISK_BBOX[2]) / 2
     center_y = (FULL_DISK_BBOX[1] + FULL_DISK_BBOX[3]) / 2
@@ -156,64 +300,304 @@ def validate_wms_availability(wms_url):
         center_y + TILE_SIZE_METERS
     ]
 
-    params["BBOX"] = ",".join(map(str, test_bbox))
+    test_query = bbox_query(",".join(map(str, test_bbox)))
     try:
-        response = requests.get(wms_url, params=params, timeout=10)
-        if response.status_code == 200:
-            img = Image.open(BytesIO(response.content))
-            return img.getbbox() is not None
-        return False
+        response = await get_with_retries(client, host_semaphore, f"{wms_url}?{test_query}", timeout=10)
+        return response.status_code == 200 and tile_has_data(response.content)
     except Exception as e:
-        print(f"Error in validate_wms_availability : {e}")
-        log_message(f"Error in validate_wms_availability : {e} \nValidation failed for {wms_url}:\n{traceback.format_exc()}")
+        fetch_logger.exception("Error in validate_wms_availability : %s \nValidation failed for %s:", e, wms_url)
         return False
 
-def fetch_and_save_tile(col, row, bbox, save_dir, wms_url, timestamp_ist, time_str_utc, file_date):
-    params = COMMON_PARAMS.copy()
-    bbox_str = ",".join(map(str, bbox))
-    params["BBOX"] = bbox_str
+def small_tile_digest(data):
+    # Content key for tiles small enough to repeat byte for byte (blank / near-blank); else None
+    return hashlib.blake2b(data, digest_size=16).digest() if len(data) <= BLANK_TILE_MAX_BYTES else None
+
+def write_file(path, data):
+    # Raw fd write of an in-memory buffer: no Python file object or userspace buffer copy
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def link_duplicate(data, tmp_path):
+    # Hardlink a previously saved tile with identical bytes to tmp_path instead of writing
+    # a new copy. Returns (linked, digest); digest is None when data is too large to dedup.
+    digest = small_tile_digest(data)
+    if digest is None:
+        return False, None
+    with _content_paths_lock:
+        source = _content_paths.get(digest)
+        if source is not None:
+            _content_paths.move_to_end(digest)
+    if source is None:
+        return False, digest
     try:
-        response = requests.get(wms_url, params=params, timeout=20)
-        if response.status_code == 200:
-            image = Image.open(BytesIO(response.content))
-            ist_str = timestamp_ist.strftime("%Y%m%d%H%M%S")
-            filename = f"3RIMG_{file_date}_{time_str_utc}_L1B_STD_V01R00_{ist_str}_BBOX_{bbox_str.replace('.', '_').replace(',', '_')}.png"
-            file_path = os.path.join(save_dir, filename)
-            image.save(file_path)
-            print(f"Tile ({col},{row}) saved with filename : {filename}")
-            log_message(f"Tile ({col},{row}) saved with filename : {filename}")
+        try:
+            os.link(source, tmp_path)
+        except FileExistsError:
+            # Leftover .part from an interrupted run
+            os.remove(tmp_path)
+            os.link(source, tmp_path)
+        return True, digest
+    except OSError:
+        # Source removed, cross-device or no hardlink support: fall back to a normal write
+        return False, digest
+
+def remember_content(digest, file_path):
+    with _content_paths_lock:
+        _content_paths[digest] = file_path
+        _content_paths.move_to_end(digest)
+        if len(_content_paths) > DEDUP_CACHE_SIZE:
+            _content_paths.popitem(last=False)
+
+def save_tile_file(file_path, data):
+    # Write under a temporary name and rename into place, so an interrupted run never
+    # leaves a truncated PNG that the skip-existing check would then trust
+    tmp_path = file_path + ".part"
+    linked, digest = link_duplicate(data, tmp_path)
+    if not linked:
+        write_file(tmp_path, data)
+    os.replace(tmp_path, file_path)
+    if digest is not None and not linked:
+        remember_content(digest, file_path)
+    return "linked" if linked else "saved"
+
+def read_archive_names(path):
+    # Member names of a finished archive from an earlier run; empty when there is none
+    try:
+        with tarfile.open(path) as tar:
+            return set(tar.getnames())
+    except (FileNotFoundError, tarfile.ReadError):
+        return set()
+
+class TileArchive:
+    # One timestamp's tiles as a tar, opened on the first tile and renamed in once sealed and drained
+
+    def __init__(self, path, carry_over):
+        self.path = path
+        self.tmp_path = path + ".part"
+        self.carry_over = carry_over
+        self.lock = threading.Lock()
+        self.digests = {}
+        self.queued = 0  # incremented on the event loop before each item is queued
+        self.handled = 0
+        self.added = 0
+        self.expected = None
+        self.tar = None
+
+    def _open(self):
+        self.tar = tarfile.open(self.tmp_path, "w")
+        if self.carry_over:
+            with tarfile.open(self.path) as old:
+                for member in old:
+                    self.tar.addfile(member, old.extractfile(member) if member.isfile() else None)
+
+    def add(self, name, data):
+        with self.lock:
+            try:
+                if self.tar is None:
+                    self._open()
+                info = tarfile.TarInfo(name)
+                info.mtime = int(time.time())
+                if not data:
+                    self.tar.addfile(info)
+                    self.added += 1
+                    return "recorded blank"
+                digest = small_tile_digest(data)
+                if digest in self.digests:
+                    info.type = tarfile.LNKTYPE
+                    info.linkname = self.digests[digest]
+                    self.tar.addfile(info)
+                    self.added += 1
+                    return "linked"
+                info.size = len(data)
+                self.tar.addfile(info, BytesIO(data))
+                self.added += 1
+                if digest is not None:
+                    self.digests[digest] = name
+                return "saved"
+            finally:
+                self.handled += 1
+                self._close_if_done()
+
+    def seal(self):
+        with self.lock:
+            self.expected = self.queued
+            self._close_if_done()
+
+    def _close_if_done(self):
+        if self.expected is not None and self.handled >= self.expected and self.tar is not None and not self.tar.closed:
+            self.tar.close()
+            if self.added:
+                os.replace(self.tmp_path, self.path)
+            else:
+                # Every add failed; keep any previous archive untouched
+                os.remove(self.tmp_path)
+
+def tile_writer(write_queue):
+    # Drains (col, row, archive, name, data) items until the None sentinel; name is a file path
+    # without an archive. "saved" lines are batched, flushed per LOG_FLUSH_LINES or finished batch.
+    saved_lines = []
+
+    def flush_saved_lines():
+        if saved_lines:
+            log_message("\n".join(saved_lines))
+            saved_lines.clear()
+
+    while True:
+        item = write_queue.get()
+        try:
+            if item is None:
+                flush_saved_lines()
+                return
+            col, row, archive, name, data = item
+            if archive is not None:
+                action = archive.add(name, data)
+                saved_lines.append(f"Tile ({col},{row}) {action} in {os.path.basename(archive.path)} as : {name}")
+            else:
+                action = save_tile_file(name, data)
+                saved_lines.append(f"Tile ({col},{row}) {action} with filename : {os.path.basename(name)}")
+            if len(saved_lines) >= LOG_FLUSH_LINES or write_queue.empty() or (archive is not None and archive.tar.closed):
+                flush_saved_lines()
+        except Exception as e:
+            flush_saved_lines()
+            fetch_logger.exception("Error in tile_writer : %s \nException while writing tile:", e)
+        finally:
+            write_queue.task_done()
+
+def is_blank_tile(data):
+    # Servers return the same bytes for every empty tile, so the PNG is decoded only the
+    # first time a given small payload is seen; later copies are a hash lookup
+    digest = small_tile_digest(data)
+    if digest is None:
+        return False
+    blank = _digest_is_blank.get(digest)
+    if blank is None:
+        blank = Image.open(BytesIO(data)).getbbox() is None
+        if len(_digest_is_blank) >= DEDUP_CACHE_SIZE:
+            _digest_is_blank.clear()
+        _digest_is_blank[digest] = blank
+    return blank
+
+def make_tile_filename_prefix(file_date, time_str_utc, ist_str):
+    return f"3RIMG_{file_date}_{time_str_utc}_L1B_STD_V01R00_{ist_str}_BBOX_"
+
+async def queue_write(write_queue, item):
+    # Hand bytes to a writer thread so the event loop can go back to issuing requests while
+    # the disk write happens. Only fall back to a blocking put (off the loop) when the queue
+    # is full.
+    try:
+        write_queue.put_nowait(item)
+    except queue.Full:
+        await asyncio.to_thread(write_queue.put, item)
+
+async def fetch_and_save_tile(client, host_semaphore, col, row, tile_query, archive, name, wms_url, write_queue):
+    try:
+        response = await get_with_retries(client, host_semaphore, f"{wms_url}?{tile_query}", timeout=20)
+        if response.status_code == 200 and not response.content.startswith(PNG_SIGNATURE):
+            # WMS errors (e.g. ServiceException XML) can come back as 200; since the bytes
+            # are written untouched, make sure they really are a PNG first
+            fetch_logger.info("Failed (%s,%s) | Response is not a PNG (%s)", col, row, response.headers.get("Content-Type"))
+        elif response.status_code == 200 and SKIP_BLANK_TILES and is_blank_tile(response.content):
+            if archive is not None:
+                # Zero-size member: no image is stored, but reruns won't request it again
+                archive.queued += 1
+                await queue_write(write_queue, (col, row, archive, name, b""))
+            return TILE_BLANK
+        elif response.status_code == 200:
+            # The server already returns a PNG, so the bytes are written untouched
+            if archive is not None:
+                archive.queued += 1
+            await queue_write(write_queue, (col, row, archive, name, response.content))
+            return TILE_SAVED
         else:
-            log_message(f"Failed ({col},{row}) | Status: {response.status_code}")
+            fetch_logger.info("Failed (%s,%s) | Status: %s", col, row, response.status_code)
     except Exception as e:
-        print(f"Error in fetch_and_save_tile : {e}")
-        log_message(f"Error in fetch_and_save_tile : {e} \nException while fetching tile ({col},{row}):\n{traceback.format_exc()}")
-
-def fetch_tiles_concurrently(tiles, save_dir, wms_url, timestamp_ist, time_str_utc, file_date):
-    success_count = 0
-    failure_count = 0
+        fetch_logger.exception("Error in fetch_and_save_tile : %s \nException while fetching tile (%s,%s):", e, col, row)
+    return None
+
+def start_tile_writers(write_queue):
+    writers = [threading.Thread(target=tile_writer, args=(write_queue,), daemon=True) for _ in range(WRITER_THREADS)]
+    for writer in writers:
+        writer.start()
+    return writers
+
+async def stop_tile_writers(write_queue, writers):
+    # Queued writes are drained before the sentinels are reached
+    for _ in writers:
+        await asyncio.to_thread(write_queue.put, None)
+    for writer in writers:
+        await asyncio.to_thread(writer.join)
+
+async def fetch_tiles_concurrently(client, host_semaphore, write_queue, indices, filename_suffixes, tile_queries, save_dir, wms_url, timestamp_ist, time_str_utc, file_date):
+    # One listing up front (directory or archive members) replaces an HTTP request per tile
+    # already saved by an earlier run
+    prefix = make_tile_filename_prefix(file_date, time_str_utc, timestamp_ist.strftime("%Y%m%d%H%M%S"))
+    if SAVE_TILES_AS_TAR:
+        archive_path = os.path.join(save_dir, prefix[:-len("_BBOX_")] + ".tar")
+        existing = await asyncio.to_thread(read_archive_names, archive_path)
+        name_prefix = ""
+    else:
+        existing = {e.name for e in os.scandir(save_dir)}
+        name_prefix = os.path.join(save_dir, "")
+    pending = []
+    for (col, row), suffix, tile_query in zip(indices.tolist(), filename_suffixes, tile_queries):
+        filename = prefix + suffix
+        if filename not in existing:
+            pending.append((col, row, tile_query, name_prefix + filename))
+
+    archive = TileArchive(archive_path, bool(existing)) if SAVE_TILES_AS_TAR and pending else None
 
-    def wrapped_fetch(col, row, bbox):
-        nonlocal success_count, failure_count
-        try:
-            fetch_and_save_tile(col, row, bbox, save_dir, wms_url, timestamp_ist, time_str_utc, file_date)
-            success_count += 1
-        except Exception:
-            failure_count += 1
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [
-            executor.submit(wrapped_fetch, col, row, bbox)
-            for col, row, bbox in tiles
-        ]
-        for _ in as_completed(futures):
-            pass
-
-    total = len(tiles)
-    log_file_count_block(timestamp_ist, total, success_count, total - success_count)
+    try:
+        results = await asyncio.gather(*[
+            fetch_and_save_tile(client, host_semaphore, col, row, tile_query, archive, name, wms_url, write_queue)
+            for col, row, tile_query, name in pending
+        ])
+    finally:
+        if archive is not None:
+            # Writers finish the archive once every queued tile (and blank record) is in;
+            # also on an abort, so the tiles fetched so far still land in a valid archive
+            await asyncio.to_thread(archive.seal)
+
+    total = len(tile_queries)
+    skipped = total - len(pending)
+    success_count = results.count(TILE_SAVED)
+    blank_count = results.count(TILE_BLANK)
+    failed_count = len(pending) - success_count - blank_count
+    log_file_count_block(timestamp_ist, total, success_count, failed_count, skipped, blank_count)
+
+# ------------------ TIMESTAMPS ------------------
+
+def iter_half_hours(start_dt, end_dt):
+    # WMS frames exist only at :15 and :45
+    current_dt = start_dt
+    while current_dt <= end_dt:
+        if current_dt.minute in (15, 45):
+            yield current_dt
+        current_dt += timedelta(minutes=30)
+
+def format_dt(current_dt):
+    # Returns (file_date, time_str_utc, wms_url) for an IST timestamp
+    dt_utc = current_dt.astimezone(UTC)
+    folder_date = dt_utc.strftime("%Y/%d%b").upper()
+    file_date = dt_utc.strftime("%d%b%Y").upper()
+    time_str_utc = dt_utc.strftime("%H%M")
+
+    wms_url = WMS_BASE_TEMPLATE.format(
+        folder_date=folder_date,
+        file_date=file_date,
+        time=time_str_utc
+    )
+    return file_date, time_str_utc, wms_url
 
 # ------------------ MAIN ------------------
 
-def main():
+async def main():
+    listener = setup_logging()
+    client = writers = write_queue = None
     try:
         # --- Future support for start and end times ---
         # date_input = input("Enter date (YYYY-MM-DD): ").strip()
@@ -230,9 +614,8 @@ def main():
         # start_time_input = start_time_input.zfill(5)
         # end_time_input = end_time_input.zfill(5)
 
-        # ist = pytz.timezone("Asia/Kolkata")
-        # start_dt = ist.localize(datetime.strptime(f"{date_input} {start_time_input}", "%Y-%m-%d %H:%M"))
-        # end_dt = ist.localize(datetime.strptime(f"{date_input} {end_time_input}", "%Y-%m-%d %H:%M"))
+        # start_dt = datetime.strptime(f"{date_input} {start_time_input}", "%Y-%m-%d %H:%M").replace(tzinfo=IST)
+        # end_dt = datetime.strptime(f"{date_input} {end_time_input}", "%Y-%m-%d %H:%M").replace(tzinfo=IST)
 
         # if start_dt.minute not in [15, 45] or end_dt.minute not in [15, 45]:
         #     log_message("Frames only available at :15 or :45 of every hour.")
@@ -242,8 +625,7 @@ def main():
         #     return
 
         # --- Current input: reference datetime (loop back 10 days) ---
-        ist = pytz.timezone("Asia/Kolkata")
-        now_ist = datetime.now(ist)
+        now_ist = datetime.now(IST)
 
         # Round down to last available WMS time: either :15 or :45
         minute = now_ist.minute
@@ -258,7 +640,6 @@ def main():
         last_available_dt = now_ist.replace(minute=rounded_minute, second=0, microsecond=0)
 
         start_dt = last_available_dt - timedelta(days=NUM_PAST_DAYS)
-        current_dt = start_dt
 
         print(f"Auto-calculated last available WMS timestamp: {last_available_dt.strftime('%Y-%m-%d %H:%M')} IST")
         print(f"Fetching frames from {start_dt.strftime('%Y-%m-%d %H:%M')} IST to {last_available_dt.strftime('%Y-%m-%d %H:%M')} IST")
@@ -266,30 +647,39 @@ def main():
         log_message(f"Auto-calculated last available WMS timestamp: {last_available_dt.strftime('%Y-%m-%d %H:%M')} IST")
         log_message(f"Fetching frames from {start_dt.strftime('%Y-%m-%d %H:%M')} IST to {last_available_dt.strftime('%Y-%m-%d %H:%M')} IST")
 
-        while current_dt <= last_available_dt:
+        # The tile grid is the same for every timestamp, so build it once
+        # tile_indices, tile_bboxes = generate_tiles(*FULL_DISK_BBOX, TILE_SIZE_METERS)
+        # tile_indices, tile_bboxes = generate_tiles(*INDIAN_SUBCONTINENT_BBOX, TILE_SIZE_METERS)
+        tile_indices, tile_bboxes = generate_tiles(*INDIA_BBOX, TILE_SIZE_METERS)
+        tile_bbox_strs = format_bbox_strings(tile_bboxes)
+        tile_queries = [bbox_query(bbox_str) for bbox_str in tile_bbox_strs]
+        tile_filename_suffixes = bbox_filename_suffixes(tile_bbox_strs)
+
+        client = make_client()
+        # Every request goes to the same MOSDAC host; fanning out all tile requests and probes
+        # at once mostly earns 429/5xx and retries, so this is the only concurrency cap
+        host_semaphore = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+        # Writers live for the whole run, so disk writes for one timestamp overlap with the
+        # availability probe and downloads of the next
+        write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writers = start_tile_writers(write_queue)
+
+        # All candidate timestamps and their WMS URLs, formatted once up front
+        candidates = [(dt, *format_dt(dt)) for dt in iter_half_hours(start_dt, last_available_dt)]
+
+        # Probe every candidate concurrently instead of one HTTPS roundtrip per loop iteration
+        print(f"Checking availability of {len(candidates)} timestamps")
+        log_message(f"Checking availability of {len(candidates)} timestamps")
+        availability = await asyncio.gather(*[
+            validate_wms_availability(client, host_semaphore, wms_url)
+            for _, _, _, wms_url in candidates
+        ])
+
+        for (current_dt, file_date, time_str_utc, wms_url), available in zip(candidates, availability):
             try:
-                if current_dt.minute not in [15, 45]:
-                    current_dt += timedelta(minutes=30)
-                    continue
-
-                dt_utc = current_dt.astimezone(pytz.utc)
-                folder_date = dt_utc.strftime("%Y/%d%b").upper()
-                file_date = dt_utc.strftime("%d%b%Y").upper()
-                time_str_utc = dt_utc.strftime("%H%M")
-
-                wms_url = WMS_BASE_TEMPLATE.format(
-                    folder_date=folder_date,
-                    file_date=file_date,
-                    time=time_str_utc
-                )
-
-                print(f"Checking availability: {current_dt.strftime('%Y-%m-%d %H:%M')} IST")
-                log_message(f"Checking availability: {current_dt.strftime('%Y-%m-%d %H:%M')} IST")
-
-                if not validate_wms_availability(wms_url):
+                if not available:
                     print(f"No data available at {current_dt.strftime('%Y-%m-%d %H:%M')} IST — skipped.")
                     log_message(f"No data available at {current_dt.strftime('%Y-%m-%d %H:%M')} IST — skipped.")
-                    current_dt += timedelta(minutes=30)
                     continue
 
                 print(f"Requesting WMS tiles from: {wms_url}")
@@ -298,25 +688,26 @@ def main():
                 tile_dir = os.path.join("RAW_DATA", "INSAT", *date_parts)
                 os.makedirs(tile_dir, exist_ok=True)
 
-                # tiles = generate_tiles(*FULL_DISK_BBOX, TILE_SIZE_METERS)
-                # tiles = generate_tiles(*INDIAN_SUBCONTINENT_BBOX, TILE_SIZE_METERS)
-                tiles = generate_tiles(*INDIA_BBOX, TILE_SIZE_METERS)
-                print(f"Total tiles to fetch: {len(tiles)}")
-                log_message(f"Total tiles to fetch: {len(tiles)}")
+                print(f"Total tiles to fetch: {len(tile_bboxes)}")
+                log_message(f"Total tiles to fetch: {len(tile_bboxes)}")
 
-                fetch_tiles_concurrently(tiles, tile_dir, wms_url, current_dt, time_str_utc, file_date)
+                await fetch_tiles_concurrently(client, host_semaphore, write_queue, tile_indices, tile_filename_suffixes, tile_queries, tile_dir, wms_url, current_dt, time_str_utc, file_date)
                 print(f"All tiles saved for {current_dt.strftime('%Y-%m-%d %H:%M')} in: {tile_dir}")
                 log_message(f"All tiles saved for {current_dt.strftime('%Y-%m-%d %H:%M')} in: {tile_dir}")
             except Exception as e:
-                print(f"Error in main : {e}")
-                log_message(f"Error in main : {e} \nException during processing {current_dt}:\n{traceback.format_exc()}")
-
-            current_dt += timedelta(minutes=30)
+                fetch_logger.exception("Error in main : %s \nException during processing %s:", e, current_dt)
 
     except Exception as e:
-        print(f"Error in main : {e}")
-        log_message(f"Error in main : {e} \nFatal error in main():\n{traceback.format_exc()}")
+        fetch_logger.exception("Error in main : %s \nFatal error in main():", e)
+    finally:
+        # Also on an abort: writers drain the queue (finishing sealed archives) and flush
+        # their buffered log lines before the listener stops
+        if writers is not None:
+            await stop_tile_writers(write_queue, writers)
+        if client is not None:
+            await client.aclose()
+        stop_logging(listener)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())